@@ -1,33 +1,29 @@
-import streamlit as st
-from dotenv import load_dotenv
-import os
+import time
+_inicio_script = time.perf_counter()
+
 import re
 from datetime import datetime
-from azure.cosmos import CosmosClient, exceptions
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.language.conversations import ConversationAnalysisClient
-from azure.ai.formrecognizer import DocumentAnalysisClient
+import streamlit as st
+from perfil import medir, activo as perfil_activo, TIEMPOS as TIEMPOS_PERFIL
 
+with medir("import almacenamiento"):
+    from almacenamiento import obtener_repositorio, ErrorAlmacenamiento, ids_de_productos
+from configuracion import obtener_configuracion
+from huellas import escribir_cambiados
+from autocompletado import obtener_indice, actualizar_indice
+from servicios_azure import init_form_recognizer, init_clu
 
-# Cargar variables de entorno
-load_dotenv()
+# Criterio de búsqueda -> campo del documento
+CAMPOS_BUSQUEDA = {"marca": "Marca", "pulgadas": "Pulgadas", "modelo": "Modelo", "procesador": "Procesador"}
 
-def obtener_marcas_y_pulgadas(container):
+def obtener_marcas_y_pulgadas(repositorio):
     try:
-        load_dotenv()
-        # Consultas para obtener marcas y pulgadas únicas
-        query_marcas = "SELECT DISTINCT c.Marca FROM c"
-        query_pulgadas = "SELECT DISTINCT c.Pulgadas FROM c"
-
-        marcas = list(container.query_items(query=query_marcas, enable_cross_partition_query=True))
-        pulgadas = list(container.query_items(query=query_pulgadas, enable_cross_partition_query=True))
-
-        # Extraer los valores, asegurándose de que no sean None
-        marcas = [item['Marca'] for item in marcas if 'Marca' in item]
-        pulgadas = [item['Pulgadas'] for item in pulgadas if 'Pulgadas' in item and item['Pulgadas'] is not None]
+        # Marcas y pulgadas únicas (sin valores None)
+        marcas = repositorio.facetas("Marca")
+        pulgadas = repositorio.facetas("Pulgadas")
 
         return marcas, pulgadas
-    except exceptions.CosmosHttpResponseError as e:
+    except ErrorAlmacenamiento as e:
         st.error(f"🚨 Error al obtener marcas y pulgadas: {str(e)}")
         return [], []
     except Exception as e:
@@ -91,28 +87,13 @@ def transformar_entidades(entidades):
 
     return resultado
 
-def init_form_recognizer():
-    """
-    Inicializa y retorna el cliente de Form Recognizer y el modelo custom.
+def subir_pdf(file, repositorio):
     """
-    AZURE_ENDPOINT_DOC = os.getenv("AZURE_ENDPOINT_DOCUMEN_INTELLIGENCE")
-    AZURE_API_KEY_DOC = os.getenv("AZURE_API_KEY_DOCUMEN_INTELLIGENCE")
-    MODEL_ID = os.getenv("MODEL")
-    if not all([AZURE_ENDPOINT_DOC, AZURE_API_KEY_DOC, MODEL_ID]):
-        raise ValueError("Faltan variables de entorno para Form Recognizer.")
-    client = DocumentAnalysisClient(
-        endpoint=AZURE_ENDPOINT_DOC,
-        credential=AzureKeyCredential(AZURE_API_KEY_DOC)
-    )
-    return client, MODEL_ID
-
-document_analysis_client, MODEL_ID = init_form_recognizer()
-
-def subir_pdf(file, container):
-    """
-    Procesa el PDF subido mediante Custom Named Entity Recognition y lo inserta en la BD.
+    Procesa el PDF subido mediante Custom Named Entity Recognition y inserta en la BD
+    todos los productos que contenga, con una sola llamada de análisis.
     """
     try:
+        document_analysis_client, MODEL_ID = init_form_recognizer()
         poller = document_analysis_client.begin_analyze_document(
             model_id=MODEL_ID,
             document=file
@@ -122,26 +103,43 @@ def subir_pdf(file, container):
         st.error(f"❌ Error al analizar el PDF: {e}")
         return
 
-    st.write("📄 Se han extraído las siguientes entidades del PDF:")
-    entidades_raw = {}
-    for idx, (field_name, field_value) in enumerate(result.documents[0].fields.items()):
-        st.write(f"{idx+1}. {field_name}: {field_value.value} (Confianza: {field_value.confidence})")
-        entidades_raw[field_name] = {"valor": field_value.value, "confianza": field_value.confidence}
-
-    # Transformar las entidades al formato deseado
-    entidades_transformadas = transformar_entidades(entidades_raw)
-    document_id = file.name  # Utilizamos el nombre del archivo como ID
-    documento = {
-        "id": document_id,
-        "nombre_archivo": file.name,
-        "fecha_procesamiento": datetime.now().isoformat(),
-    }
-    documento.update(entidades_transformadas)
+    if not result.documents:
+        st.warning(f"⚠️ No se ha detectado ningún producto en '{file.name}'.")
+        return
+
+    st.write(f"📄 Se han extraído las siguientes entidades del PDF ({len(result.documents)} productos):")
+    productos = []
+    for num, analyzed_document in enumerate(result.documents, start=1):
+        entidades_raw = {}
+        with st.expander(f"Producto {num}", expanded=len(result.documents) == 1):
+            for idx, (field_name, field_value) in enumerate(analyzed_document.fields.items()):
+                st.write(f"{idx+1}. {field_name}: {field_value.value} (Confianza: {field_value.confidence})")
+                entidades_raw[field_name] = {"valor": field_value.value, "confianza": field_value.confidence}
+        # Transformar las entidades al formato deseado
+        productos.append(transformar_entidades(entidades_raw))
+
+    fecha_procesamiento = datetime.now().isoformat()
+    documentos = []
+    for document_id, entidades_transformadas in zip(ids_de_productos(file.name, productos), productos):
+        documento = {
+            "id": document_id,
+            "nombre_archivo": file.name,
+            "fecha_procesamiento": fecha_procesamiento,
+        }
+        documento.update(entidades_transformadas)
+        documentos.append(documento)
 
     try:
-        container.upsert_item(documento)
-        st.success(f"✅ Documento '{file.name}' insertado en la base de datos.")
-    except exceptions.CosmosHttpResponseError as e:
+        resultado = escribir_cambiados(repositorio, documentos)
+        # Los productos nuevos o modificados aparecen ya en las sugerencias de búsqueda
+        escritos = set(resultado["completos"] + resultado["parcheados"])
+        actualizar_indice(repositorio, [documento for documento in documentos if documento["id"] in escritos])
+        if len(resultado["omitidos"]) == len(documentos):
+            st.info(f"ℹ️ El documento '{file.name}' ya estaba en la base de datos sin cambios.")
+        else:
+            st.success(f"✅ Documento '{file.name}': {len(resultado['completos'])} productos insertados, "
+                       f"{len(resultado['parcheados'])} actualizados y {len(resultado['omitidos'])} sin cambios.")
+    except ErrorAlmacenamiento as e:
         st.error(f"❌ Error al insertar el documento en la base de datos: {e}")
 
 #############################
@@ -150,16 +148,9 @@ def subir_pdf(file, container):
 
 def main():
     try:
-        load_dotenv()
-        ls_prediction_endpoint = os.getenv('LS_CONVERSATIONS_ENDPOINT')
-        ls_prediction_key = os.getenv('LS_CONVERSATIONS_KEY')
-        cosmos_endpoint = os.getenv('COSMOS_ENDPOINT')
-        cosmos_key = os.getenv('COSMOS_KEY')
-
-        # Crear cliente de Cosmos DB y obtener el contenedor
-        cosmos_client = CosmosClient(cosmos_endpoint, cosmos_key)
-        database = cosmos_client.get_database_client("OrdenadoresDB")
-        container = database.get_container_client("Especificaciones")
+        # Repositorio de ordenadores (Cosmos DB, MongoDB o SQLite según ALMACENAMIENTO)
+        with medir("conexión a la base de datos"):
+            repositorio = obtener_repositorio()
 
         st.set_page_config(
             page_icon="💻",
@@ -181,7 +172,8 @@ def main():
 
         # Filtros avanzados
         with st.sidebar.expander("🔍 Filtros Avanzados"):
-            marcas, pulgadas = obtener_marcas_y_pulgadas(container)
+            with medir("facetas marcas y pulgadas"):
+                marcas, pulgadas = obtener_marcas_y_pulgadas(repositorio)
             
             selected_brand = st.selectbox("Marca", [""] + marcas, key="marca_select")
             selected_size = st.selectbox("Pulgadas", [""] + pulgadas, key="pulgadas_select")
@@ -190,8 +182,15 @@ def main():
         # Sección para subir PDF
         st.sidebar.header("📤 Subir Nuevo Producto")
         uploaded_file = st.sidebar.file_uploader("Subir ficha técnica (PDF)", type="pdf")
+        # El archivo sigue en el uploader en cada rerun (buscar, filtrar...): sólo se analiza una vez
+        if "pdfs_procesados" not in st.session_state:
+            st.session_state.pdfs_procesados = set()
         if uploaded_file is not None:
-            subir_pdf(uploaded_file, container)
+            if uploaded_file.file_id in st.session_state.pdfs_procesados:
+                st.sidebar.caption(f"'{uploaded_file.name}' ya se ha procesado.")
+            else:
+                st.session_state.pdfs_procesados.add(uploaded_file.file_id)
+                subir_pdf(uploaded_file, repositorio)
 
        # Búsqueda principal por texto natural
         st.header("Búsqueda Inteligente")
@@ -216,38 +215,62 @@ def main():
             )
             buscar_natural = st.button("🔍 Buscar", help="Buscar ordenadores según la descripción proporcionada.",)
 
+        # Sugerencias de marcas, modelos y procesadores: elegir una busca directamente, sin CLU
+        # El índice sólo se construye cuando hay texto; si falla, se busca sin sugerencias
+        indice = None
+        if user_input:
+            try:
+                with medir("índice de autocompletado"):
+                    indice = obtener_indice(repositorio, obtener_configuracion().autocompletado_ttl)
+            except ErrorAlmacenamiento as ex:
+                print(f"Error al construir el índice de autocompletado: {ex}")
+        sugerencia = None
+        sugerencias = indice.sugerir(user_input) if indice is not None else []
+        if sugerencias:
+            cols_sugerencias = st.columns(len(sugerencias))
+            for idx, s in enumerate(sugerencias):
+                # La clave es el valor y no la posición: el clic se atiende en el siguiente rerun,
+                # cuando la lista puede haber cambiado de orden
+                if cols_sugerencias[idx].button(s.valor, key=f"sugerencia_{s.campo}_{s.valor}", help=f"{s.campo} ({s.productos} ordenadores)"):
+                    sugerencia = s
+        # Si el texto es exactamente una marca, un modelo o un procesador, tampoco hace falta CLU
+        if sugerencia is None and buscar_natural and indice is not None:
+            sugerencia = indice.exacta(user_input)
 
         # Sección para mostrar resultados
         st.header("Resultados de Búsqueda")
         
+        # Procesar búsqueda por sugerencia
+        if sugerencia is not None:
+            items = ejecutar_consulta(repositorio, {sugerencia.campo.lower(): sugerencia.valor})
+
         # Procesar búsqueda natural
-        if buscar_natural and user_input:
-            # Cliente para CLU
-            client = ConversationAnalysisClient(ls_prediction_endpoint, AzureKeyCredential(ls_prediction_key))
+        elif buscar_natural and user_input:
+            # Cliente para CLU (se reutiliza entre búsquedas)
+            client = init_clu()
             cls_project = 'OrdenadoresConversational'
             deployment_slot = 'IntentOrdenadores'
             
-            with client:
-                result = client.analyze_conversation(
-                    task={
-                        "kind": "Conversation",
-                        "analysisInput": {
-                            "conversationItem": {
-                                "participantId": "1",
-                                "id": "1",
-                                "modality": "text",
-                                "language": "es",
-                                "text": user_input
-                            },
-                            "isLoggingEnabled": False
+            result = client.analyze_conversation(
+                task={
+                    "kind": "Conversation",
+                    "analysisInput": {
+                        "conversationItem": {
+                            "participantId": "1",
+                            "id": "1",
+                            "modality": "text",
+                            "language": "es",
+                            "text": user_input
                         },
-                        "parameters": {
-                            "projectName": cls_project,
-                            "deploymentName": deployment_slot,
-                            "verbose": True
-                        }
+                        "isLoggingEnabled": False
+                    },
+                    "parameters": {
+                        "projectName": cls_project,
+                        "deploymentName": deployment_slot,
+                        "verbose": True
                     }
-                )
+                }
+            )
 
             entities = result["result"]["prediction"]["entities"]
 
@@ -293,17 +316,7 @@ def main():
                 elif category == "pulgadas":
                     search_criteria["pulgadas"] = text.replace(',', '.')
 
-            # Construir consulta
-            query_parts = []
-            parameters = []
-            if search_criteria["marca"]:
-                query_parts.append("c.Marca = @marca")
-                parameters.append({"name": "@marca", "value": search_criteria["marca"]})
-            if search_criteria["pulgadas"]:
-                query_parts.append("c.Pulgadas = @pulgadas")
-                parameters.append({"name": "@pulgadas", "value": search_criteria["pulgadas"]})
-
-            items = ejecutar_consulta(container, query_parts, parameters)
+            items = ejecutar_consulta(repositorio, search_criteria)
 
         # Procesar búsqueda por filtros
         if st.sidebar.button("✅ Aplicar Filtros", key="aplicar_filtros"):
@@ -311,17 +324,8 @@ def main():
                 "marca": selected_brand,
                 "pulgadas": selected_size
             }
-            
-            query_parts = []
-            parameters = []
-            if search_criteria["marca"]:
-                query_parts.append("c.Marca = @marca")
-                parameters.append({"name": "@marca", "value": search_criteria["marca"]})
-            if search_criteria["pulgadas"]:
-                query_parts.append("c.Pulgadas = @pulgadas")
-                parameters.append({"name": "@pulgadas", "value": search_criteria["pulgadas"]})
-
-            items = ejecutar_consulta(container, query_parts, parameters)
+
+            items = ejecutar_consulta(repositorio, search_criteria)
             
 
         # Botón de Resetear debajo
@@ -334,26 +338,32 @@ def main():
         if 'items' in locals():
             mostrar_resultados(items)
 
+        if perfil_activo():
+            mostrar_perfil_arranque()
+
     except Exception as e:
         st.error(f"❌ Error en la aplicación: {str(e)}")
 
-def ejecutar_consulta(container, query_parts, parameters):
-    """Ejecuta la consulta en Cosmos DB"""
+def mostrar_perfil_arranque():
+    """Muestra en la barra lateral (y en consola) el coste de cada import e inicialización"""
+    total = (time.perf_counter() - _inicio_script) * 1000
+    with st.sidebar.expander("⏱️ Perfil de arranque"):
+        for componente, ms in TIEMPOS_PERFIL.items():
+            st.write(f"{componente}: {ms:.1f} ms")
+        st.write(f"**Esta ejecución del script: {total:.1f} ms**")
+    print("⏱️ Perfil de arranque: " + ", ".join(f"{c}={ms:.1f}ms" for c, ms in TIEMPOS_PERFIL.items()) + f" | ejecución={total:.1f}ms")
+
+def ejecutar_consulta(repositorio, search_criteria):
+    """Ejecuta la consulta en la base de datos con los criterios que tengan valor"""
+    criterios = {
+        CAMPOS_BUSQUEDA[criterio]: valor
+        for criterio, valor in search_criteria.items()
+        if valor
+    }
     try:
-        if query_parts:
-            query = "SELECT * FROM c WHERE " + " AND ".join(query_parts)
-            return list(container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-        else:
-            return list(container.query_items(
-                query="SELECT * FROM c",
-                enable_cross_partition_query=True
-            ))
-    except exceptions.CosmosHttpResponseError as e:
-        st.error(f"🚨 Error en la base de datos: {e.message}")
+        return repositorio.consultar(criterios)
+    except ErrorAlmacenamiento as e:
+        st.error(f"🚨 Error en la base de datos: {e}")
         return []
 
 def mostrar_resultados(items):
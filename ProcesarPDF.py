@@ -3,8 +3,9 @@ import re
 from datetime import datetime
 from azure.ai.formrecognizer import DocumentAnalysisClient
 from azure.core.credentials import AzureKeyCredential
-from azure.cosmos import CosmosClient, exceptions
 from dotenv import load_dotenv
+from almacenamiento import obtener_repositorio, ErrorAlmacenamiento, ids_de_productos
+from huellas import escribir_cambiados
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
@@ -15,7 +16,7 @@ load_dotenv()
 AZURE_ENDPOINT_DOC = os.getenv("AZURE_ENDPOINT_DOCUMEN_INTELLIGENCE")
 AZURE_API_KEY_DOC = os.getenv("AZURE_API_KEY_DOCUMEN_INTELLIGENCE")
 MODEL_ID = os.getenv("MODEL")
-PDF_DIRECTORY = "C:\\Users\\Alumno_AI\\Downloads\\Fichas técnicas"  # Ajusta la ruta según corresponda
+PDF_DIRECTORY = os.getenv("PDF_DIRECTORY", "C:\\Users\\Alumno_AI\\Downloads\\Fichas técnicas")  # Ajusta la ruta según corresponda
 
 if not all([AZURE_ENDPOINT_DOC, AZURE_API_KEY_DOC, MODEL_ID]):
     raise ValueError("Faltan variables de entorno para Form Recognizer. Verifica tu archivo .env")
@@ -27,20 +28,9 @@ document_analysis_client = DocumentAnalysisClient(
 )
 
 # -------------------------
-# Configuración Cosmos DB
+# Configuración de la base de datos (Cosmos DB, MongoDB o SQLite según ALMACENAMIENTO)
 # -------------------------
-COSMOS_ENDPOINT = os.getenv("COSMOS_ENDPOINT")
-COSMOS_KEY = os.getenv("COSMOS_KEY")
-DB_NAME = "OrdenadoresDB"
-CONTAINER_NAME = "Especificaciones"
-
-if not all([COSMOS_ENDPOINT, COSMOS_KEY, DB_NAME, CONTAINER_NAME]):
-    raise ValueError("Faltan variables de entorno para Cosmos DB. Verifica tu archivo .env")
-
-# Inicializar el cliente de Cosmos DB
-cosmos_client = CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY)
-database = cosmos_client.get_database_client(DB_NAME)
-container = database.get_container_client(CONTAINER_NAME)
+repositorio = obtener_repositorio()
 
 def transformar_entidades(entidades):
     """
@@ -129,28 +119,27 @@ def transformar_entidades(entidades):
 
     return resultado
 
-def analizar_pdf(pdf_path):
-    # Generar el id único basado solo en el nombre del archivo
-    document_id = os.path.basename(pdf_path)
+def analizar_pdf(pdf_path, omitir_existentes=True):
+    """
+    Analiza un PDF con Form Recognizer e inserta en la base de datos todos los productos
+    que contenga (un catálogo se analiza con una sola llamada).
+    Con omitir_existentes=False se vuelve a procesar aunque ya exista (p. ej. si el
+    archivo ha cambiado). Devuelve False si la inserción falla.
+    """
+    nombre_archivo = os.path.basename(pdf_path)
     
-    # Comprobar si el documento ya existe en la base de datos
-    try:
-        query = f"SELECT * FROM c WHERE c.id = @id"
-        parameters = [{"name": "@id", "value": document_id}]
-        
-        existing_item = list(container.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-        
-        if existing_item:
-            print(f"⚠️ El documento {os.path.basename(pdf_path)} ya está en la base de datos. Se omite la inserción.")
-            return  # Si el documento ya existe, no lo insertamos
-        
-    except exceptions.CosmosHttpResponseError as e:
-        print(f"❌ Error al comprobar si el documento existe en Cosmos DB: {str(e)}")
-        return
+    # Comprobar si el archivo ya está en la base de datos
+    if omitir_existentes:
+        try:
+            existing_item = repositorio.consultar({"nombre_archivo": nombre_archivo})
+            
+            if existing_item:
+                print(f"⚠️ El documento {os.path.basename(pdf_path)} ya está en la base de datos. Se omite la inserción.")
+                return  # Si el documento ya existe, no lo insertamos
+            
+        except ErrorAlmacenamiento as e:
+            print(f"❌ Error al comprobar si el documento existe en la base de datos: {str(e)}")
+            return
 
     with open(pdf_path, "rb") as pdf_file:
         poller = document_analysis_client.begin_analyze_document(
@@ -159,33 +148,44 @@ def analizar_pdf(pdf_path):
         )
         result = poller.result()
 
-    # Imprimir las entidades detectadas (formato original)
-    print(f"\n--- Entidades detectadas en {pdf_path} ---\n")
-    entidades_raw = {}
-    for idx, (field_name, field_value) in enumerate(result.documents[0].fields.items()):
-        print(f"{idx+1}. {field_name}: {field_value.value} (Confianza: {field_value.confidence})")
-        entidades_raw[field_name] = {
-            "valor": field_value.value,
-            "confianza": field_value.confidence
+    if not result.documents:
+        print(f"⚠️ No se ha detectado ningún producto en {pdf_path}")
+        return True
+
+    # Imprimir las entidades detectadas (formato original) y transformarlas al formato deseado
+    productos = []
+    for num, analyzed_document in enumerate(result.documents, start=1):
+        print(f"\n--- Entidades detectadas en {pdf_path} (producto {num} de {len(result.documents)}) ---\n")
+        entidades_raw = {}
+        for idx, (field_name, field_value) in enumerate(analyzed_document.fields.items()):
+            print(f"{idx+1}. {field_name}: {field_value.value} (Confianza: {field_value.confidence})")
+            entidades_raw[field_name] = {
+                "valor": field_value.value,
+                "confianza": field_value.confidence
+            }
+        productos.append(transformar_entidades(entidades_raw))
+
+    # Construir los documentos finales a insertar en la base de datos
+    fecha_procesamiento = datetime.now().isoformat()
+    documentos = []
+    for document_id, entidades_transformadas in zip(ids_de_productos(nombre_archivo, productos), productos):
+        documento = {
+            "id": document_id,
+            "nombre_archivo": nombre_archivo,
+            "fecha_procesamiento": fecha_procesamiento,
         }
-
-    # Transformar las entidades al formato deseado
-    entidades_transformadas = transformar_entidades(entidades_raw)
-    
-    # Construir el documento final a insertar en Cosmos DB
-    documento = {
-        "id": document_id,  # Usamos solo el nombre del archivo como ID
-        "nombre_archivo": os.path.basename(pdf_path),
-        "fecha_procesamiento": datetime.now().isoformat(),
-    }
-    documento.update(entidades_transformadas)  # Se agregan las claves planas (Marca, Modelo, etc.)
+        documento.update(entidades_transformadas)  # Se agregan las claves planas (Marca, Modelo, etc.)
+        documentos.append(documento)
     
-    # Insertar el documento en Cosmos DB
+    # Insertar los documentos en la base de datos (sólo los que han cambiado, en una escritura masiva)
     try:
-        container.upsert_item(documento)
-        print(f"✅ Documento insertado en Cosmos DB: {documento['nombre_archivo']}")
-    except exceptions.CosmosHttpResponseError as e:
-        print(f"❌ Error al insertar el documento en Cosmos DB: {str(e)}")
+        resultado = escribir_cambiados(repositorio, documentos)
+        print(f"✅ {nombre_archivo}: {len(resultado['completos'])} productos insertados, "
+              f"{len(resultado['parcheados'])} actualizados y {len(resultado['omitidos'])} sin cambios")
+        return True
+    except ErrorAlmacenamiento as e:
+        print(f"❌ Error al insertar el documento en la base de datos: {str(e)}")
+        return False
 
 if __name__ == "__main__":
     # Procesar cada PDF en la carpeta
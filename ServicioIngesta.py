@@ -0,0 +1,405 @@
+import argparse
+import importlib
+import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+
+# inotify sólo existe en Linux; en el resto de sistemas se vigila por sondeo
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+# Cargar variables de entorno desde el archivo .env
+load_dotenv()
+
+# -------------------------
+# Configuración
+# -------------------------
+EXTENSIONES = {".pdf": "pdf", ".txt": "txt"}
+COLA_PATH = os.getenv("INGESTA_COLA", "cola_ingesta.db")
+NUM_WORKERS = int(os.getenv("INGESTA_WORKERS", "4"))
+MAX_INTENTOS = int(os.getenv("INGESTA_MAX_INTENTOS", "5"))
+ESPERA_BASE = float(os.getenv("INGESTA_ESPERA_BASE", "5"))  # segundos, se duplica en cada reintento
+INTERVALO_SONDEO = float(os.getenv("INGESTA_INTERVALO_SONDEO", "2"))
+
+
+def tipo_de_archivo(ruta):
+    """Devuelve 'pdf' o 'txt' según la extensión, o None si no se ingiere."""
+    return EXTENSIONES.get(os.path.splitext(ruta)[1].lower())
+
+
+def huella_archivo(ruta):
+    """Huella barata de la versión del archivo (mtime y tamaño), o None si ya no existe."""
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+#############################
+# Cola persistente
+#############################
+
+class ColaPersistente:
+    """
+    Cola de trabajos en SQLite. Hay una fila por archivo; volver a encolar un archivo
+    sólo lo reactiva si su huella ha cambiado, así que los duplicados no cuestan nada.
+    Estados: pendiente -> en_curso -> hecho, o muerto tras MAX_INTENTOS fallos.
+    Si el archivo cambia mientras un worker lo procesa, la fila sigue en_curso (nadie más
+    la toma) con la huella nueva, y al terminar vuelve a pendiente para procesar esa versión.
+    """
+
+    def __init__(self, path=COLA_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        self.hay_trabajo = threading.Event()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    ruta TEXT PRIMARY KEY,
+                    tipo TEXT NOT NULL,
+                    huella TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    disponible_en REAL NOT NULL,
+                    ultimo_error TEXT,
+                    actualizado REAL NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_trabajos_pendientes ON trabajos (estado, disponible_en)"
+            )
+            # Los trabajos que quedaron a medias en una ejecución anterior vuelven a la cola
+            self.conn.execute("UPDATE trabajos SET estado = 'pendiente' WHERE estado = 'en_curso'")
+
+    def encolar(self, ruta, tipo, huella):
+        ahora = time.time()
+        with self.lock:
+            cur = self.conn.execute("""
+                INSERT INTO trabajos (ruta, tipo, huella, estado, intentos, disponible_en, actualizado)
+                VALUES (?, ?, ?, 'pendiente', 0, ?, ?)
+                ON CONFLICT(ruta) DO UPDATE SET
+                    huella = excluded.huella,
+                    estado = CASE WHEN trabajos.estado = 'en_curso' THEN 'en_curso' ELSE 'pendiente' END,
+                    intentos = 0,
+                    ultimo_error = NULL,
+                    disponible_en = excluded.disponible_en,
+                    actualizado = excluded.actualizado
+                WHERE trabajos.huella != excluded.huella
+            """, (ruta, tipo, huella, ahora, ahora))
+            nuevo = cur.rowcount > 0
+        if nuevo:
+            self.hay_trabajo.set()
+        return nuevo
+
+    def tomar(self):
+        """Reserva el siguiente trabajo disponible. Retorna (ruta, tipo, huella, intentos) o None."""
+        with self.lock:
+            fila = self.conn.execute("""
+                SELECT ruta, tipo, huella, intentos FROM trabajos
+                WHERE estado = 'pendiente' AND disponible_en <= ?
+                ORDER BY disponible_en LIMIT 1
+            """, (time.time(),)).fetchone()
+            if fila is None:
+                self.hay_trabajo.clear()
+                return None
+            self.conn.execute(
+                "UPDATE trabajos SET estado = 'en_curso', actualizado = ? WHERE ruta = ?",
+                (time.time(), fila[0])
+            )
+            return fila
+
+    def _reactivar_si_cambio(self, ruta, huella, ahora):
+        # Si el archivo cambió mientras se procesaba, la fila tiene otra huella: vuelve a la cola
+        cur = self.conn.execute("""
+            UPDATE trabajos SET estado = 'pendiente', disponible_en = ?, actualizado = ?
+            WHERE ruta = ? AND estado = 'en_curso' AND huella != ?
+        """, (ahora, ahora, ruta, huella))
+        if cur.rowcount > 0:
+            self.hay_trabajo.set()
+
+    def completar(self, ruta, huella):
+        ahora = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE trabajos SET estado = 'hecho', actualizado = ? WHERE ruta = ? AND huella = ?",
+                (ahora, ruta, huella)
+            )
+            self._reactivar_si_cambio(ruta, huella, ahora)
+
+    def fallar(self, ruta, huella, intentos, error):
+        intentos += 1
+        ahora = time.time()
+        if intentos >= MAX_INTENTOS:
+            estado, disponible_en = "muerto", ahora
+        else:
+            estado, disponible_en = "pendiente", ahora + ESPERA_BASE * 2 ** (intentos - 1)
+        with self.lock:
+            self.conn.execute("""
+                UPDATE trabajos SET estado = ?, intentos = ?, disponible_en = ?, ultimo_error = ?, actualizado = ?
+                WHERE ruta = ? AND huella = ?
+            """, (estado, intentos, disponible_en, str(error), ahora, ruta, huella))
+            self._reactivar_si_cambio(ruta, huella, ahora)
+        return estado
+
+    def reintentar_muertos(self):
+        with self.lock:
+            cur = self.conn.execute("""
+                UPDATE trabajos SET estado = 'pendiente', intentos = 0, disponible_en = ?
+                WHERE estado = 'muerto'
+            """, (time.time(),))
+        self.hay_trabajo.set()
+        return cur.rowcount
+
+    def resumen(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall())
+
+    def muertos(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT ruta, intentos, ultimo_error FROM trabajos WHERE estado = 'muerto' ORDER BY ruta"
+            ).fetchall()
+
+
+#############################
+# Procesamiento
+#############################
+
+_clientes_txt = None
+_clientes_lock = threading.Lock()
+
+
+def procesar_pdf(ruta):
+    # Se importa aquí para no inicializar Form Recognizer hasta que llegue el primer PDF
+    import ProcesarPDF
+    if ProcesarPDF.analizar_pdf(ruta, omitir_existentes=False) is False:
+        raise RuntimeError("no se pudo guardar el documento en la base de datos")
+
+
+def procesar_txt(ruta):
+    global _clientes_txt
+    custom_entities = importlib.import_module("custom-entities")
+    with _clientes_lock:
+        if _clientes_txt is None:
+            _clientes_txt = custom_entities.init_clientes()
+    if not custom_entities.procesar_textos([ruta], *_clientes_txt):
+        raise RuntimeError("no se pudieron extraer ni guardar las entidades del texto")
+
+
+PROCESADORES = {"pdf": procesar_pdf, "txt": procesar_txt}
+
+
+def worker(cola, parada):
+    while not parada.is_set():
+        trabajo = cola.tomar()
+        if trabajo is None:
+            # Se despierta al encolar algo nuevo o, como tarde, cuando vence algún reintento
+            cola.hay_trabajo.wait(timeout=1)
+            continue
+        ruta, tipo, huella, intentos = trabajo
+        if huella_archivo(ruta) is None:
+            print(f"⚠️ El archivo {ruta} ya no existe. Se descarta.")
+            cola.completar(ruta, huella)
+            continue
+        try:
+            PROCESADORES[tipo](ruta)
+            cola.completar(ruta, huella)
+        except Exception as e:
+            estado = cola.fallar(ruta, huella, intentos, e)
+            if estado == "muerto":
+                print(f"🚨 {ruta} ha fallado {MAX_INTENTOS} veces y pasa a la cola de muertos: {e}")
+            else:
+                print(f"❌ Error al procesar {ruta} (intento {intentos + 1}): {e}")
+
+
+#############################
+# Vigilancia de carpetas
+#############################
+
+# ruta -> huella de los archivos ya avisados por nombre repetido, para no avisar en cada sondeo
+_avisados = {}
+
+
+def nombre_en_otra_carpeta(ruta, carpetas):
+    """
+    Carpeta vigilada distinta de la de `ruta` con un archivo del mismo nombre, o None. La id
+    del producto es el nombre del archivo, así que los dos se sobrescribirían en el catálogo.
+    """
+    nombre = os.path.basename(ruta)
+    propia = os.path.dirname(ruta)
+    for carpeta in carpetas:
+        if carpeta != propia and os.path.exists(os.path.join(carpeta, nombre)):
+            return carpeta
+    return None
+
+
+def encolar_si_procede(cola, ruta, carpetas):
+    tipo = tipo_de_archivo(ruta)
+    huella = huella_archivo(ruta)
+    if not (tipo and huella):
+        return
+    otra = nombre_en_otra_carpeta(ruta, carpetas)
+    if otra is not None:
+        if _avisados.get(ruta) != huella:
+            _avisados[ruta] = huella
+            print(f"⚠️ {ruta} no se ingiere: en {otra} hay otro archivo con el mismo nombre y tendrían la misma id.")
+        return
+    if cola.encolar(ruta, tipo, huella):
+        print(f"📥 Encolado: {ruta}")
+
+
+def escanear(cola, carpeta, carpetas):
+    try:
+        entradas = [entrada.path for entrada in os.scandir(carpeta) if entrada.is_file()]
+    except OSError as e:
+        print(f"⚠️ No se puede leer la carpeta {carpeta}: {e}. Se reintentará.")
+        return
+    for ruta in entradas:
+        encolar_si_procede(cola, ruta, carpetas)
+
+
+def escaneo_inicial(cola, carpetas):
+    """Encola lo que haya cambiado mientras el servicio estaba parado."""
+    for carpeta in carpetas:
+        escanear(cola, carpeta, carpetas)
+
+
+def vigilar_inotify(cola, carpetas, parada):
+    inotify = INotify()
+    mascara = flags.CLOSE_WRITE | flags.MOVED_TO
+    carpetas_por_wd = {}
+    perdidas = set()
+    while not parada.is_set():
+        # Las carpetas sin vigilancia (borradas o desmontadas) se reintentan en cada vuelta;
+        # al recuperarlas se escanean para encolar lo que llegara mientras tanto
+        for carpeta in set(carpetas) - set(carpetas_por_wd.values()):
+            try:
+                wd = inotify.add_watch(carpeta, mascara)
+            except OSError as e:
+                if carpeta not in perdidas:
+                    print(f"⚠️ No se puede vigilar la carpeta {carpeta}: {e}. Se reintentará.")
+                    perdidas.add(carpeta)
+                continue
+            carpetas_por_wd[wd] = carpeta
+            if carpeta in perdidas:
+                perdidas.discard(carpeta)
+                print(f"👀 Se vuelve a vigilar {carpeta}.")
+                escanear(cola, carpeta, carpetas)
+        for evento in inotify.read(timeout=1000):
+            if evento.mask & flags.IGNORED:
+                # El kernel retira la vigilancia cuando la carpeta desaparece
+                carpeta = carpetas_por_wd.pop(evento.wd, None)
+                if carpeta is not None:
+                    print(f"⚠️ Se ha perdido la carpeta {carpeta}. Se reintentará.")
+                    perdidas.add(carpeta)
+            elif evento.name and evento.wd in carpetas_por_wd:
+                encolar_si_procede(cola, os.path.join(carpetas_por_wd[evento.wd], evento.name), carpetas)
+
+
+def vigilar_sondeo(cola, carpetas, parada):
+    # Sólo se encola un archivo cuando su huella se repite en dos sondeos seguidos,
+    # para no leer un PDF que todavía se está copiando
+    vistos = {}
+    perdidas = set()
+    while not parada.is_set():
+        for carpeta in carpetas:
+            try:
+                entradas = [entrada.path for entrada in os.scandir(carpeta) if entrada.is_file()]
+            except OSError as e:
+                # Carpeta borrada o desmontada: se reintenta en el siguiente sondeo
+                if carpeta not in perdidas:
+                    print(f"⚠️ No se puede leer la carpeta {carpeta}: {e}. Se reintentará.")
+                    perdidas.add(carpeta)
+                continue
+            if carpeta in perdidas:
+                perdidas.discard(carpeta)
+                print(f"👀 Se vuelve a vigilar {carpeta}.")
+            for ruta in entradas:
+                if tipo_de_archivo(ruta) is None:
+                    continue
+                huella = huella_archivo(ruta)
+                if huella is not None and vistos.get(ruta) == huella:
+                    encolar_si_procede(cola, ruta, carpetas)
+                vistos[ruta] = huella
+        parada.wait(INTERVALO_SONDEO)
+
+
+#############################
+# Función Principal
+#############################
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio de ingesta continua de fichas técnicas (PDF y TXT).")
+    parser.add_argument("carpetas", nargs="*", help="Carpetas a vigilar (por defecto INGESTA_CARPETAS, separadas por os.pathsep).")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Número de workers.")
+    parser.add_argument("--cola", default=COLA_PATH, help="Archivo SQLite de la cola persistente.")
+    parser.add_argument("--sondeo", action="store_true", help="Forzar la vigilancia por sondeo aunque haya inotify.")
+    parser.add_argument("--estado", action="store_true", help="Mostrar el estado de la cola y salir.")
+    parser.add_argument("--reintentar-muertos", action="store_true", help="Devolver a la cola los trabajos muertos y salir.")
+    args = parser.parse_args()
+
+    cola = ColaPersistente(args.cola)
+
+    if args.estado:
+        print(f"Estado de la cola: {cola.resumen()}")
+        for ruta, intentos, error in cola.muertos():
+            print(f"  🚨 {ruta} ({intentos} intentos): {error}")
+        return
+    if args.reintentar_muertos:
+        print(f"🔁 {cola.reintentar_muertos()} trabajos devueltos a la cola.")
+        return
+
+    carpetas = args.carpetas or [c for c in os.getenv("INGESTA_CARPETAS", "").split(os.pathsep) if c]
+    # Rutas absolutas para que la clave de cada trabajo no dependa del directorio actual
+    carpetas = list(dict.fromkeys(os.path.abspath(c) for c in carpetas))
+    if not carpetas:
+        parser.error("Indica al menos una carpeta a vigilar o define INGESTA_CARPETAS en el .env")
+    for carpeta in carpetas:
+        if not os.path.isdir(carpeta):
+            parser.error(f"No existe la carpeta: {carpeta}")
+
+    parada = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: parada.set())
+    signal.signal(signal.SIGTERM, lambda *_: parada.set())
+
+    workers = [
+        threading.Thread(target=worker, args=(cola, parada), name=f"worker-{i}", daemon=True)
+        for i in range(args.workers)
+    ]
+    for hilo in workers:
+        hilo.start()
+
+    # Se empieza a vigilar antes del escaneo inicial para no perder nada de lo que llegue mientras
+    vigilar = vigilar_sondeo if args.sondeo or INotify is None else vigilar_inotify
+    vigilante = threading.Thread(target=vigilar, args=(cola, carpetas, parada), name="vigilante", daemon=True)
+    vigilante.start()
+    escaneo_inicial(cola, carpetas)
+
+    modo = "sondeo" if vigilar is vigilar_sondeo else "inotify"
+    print(f"👀 Vigilando {', '.join(carpetas)} ({modo}, {args.workers} workers). Ctrl+C para salir.")
+    codigo = 0
+    while not parada.is_set():
+        parada.wait(1)
+        if not vigilante.is_alive() and not parada.is_set():
+            # Sin vigilante el servicio no ingiere nada: mejor terminar y que lo reinicie el supervisor
+            print("🚨 El hilo de vigilancia ha terminado inesperadamente.")
+            codigo = 1
+            parada.set()
+
+    print("⏹️ Deteniendo el servicio...")
+    cola.hay_trabajo.set()
+    for hilo in workers + [vigilante]:
+        hilo.join(timeout=30)
+    sys.exit(codigo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,553 @@
+"""
+Repositorio de ordenadores con varios backends intercambiables:
+  - "cosmos": Azure Cosmos DB (API SQL), el comportamiento original
+  - "mongo": la misma base de datos a través de la API de MongoDB (pymongo)
+  - "sqlite": base de datos local, para despliegues de un solo nodo y pruebas
+
+El backend se elige con la variable de entorno ALMACENAMIENTO (por defecto "cosmos").
+Los SDK de cada backend se importan sólo cuando se usa ese backend.
+"""
+import json
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from configuracion import obtener_configuracion
+from perfil import medir
+
+# Nombres por defecto; se pueden cambiar con BASE_DATOS y CONTENEDOR
+DB_NAME = "OrdenadoresDB"
+CONTAINER_NAME = "Especificaciones"
+
+# Clave de partición con la que se crean los contenedores de Cosmos DB que no existan
+CAMPO_PARTICION = "tipoDeOrdenador"
+
+# Campos por los que se filtra y se obtienen facetas; son los que se indexan
+CAMPOS_INDEXADOS = ["Marca", "Modelo", "Procesador", "Pulgadas"]
+
+# Ids por consulta al pedir huellas en bloque
+TAMANO_LOTE_IDS = 500
+
+
+def ids_de_productos(nombre_archivo, productos):
+    """
+    Genera una id estable para cada producto de un PDF. Si el PDF tiene un solo producto
+    se usa el nombre del archivo, como siempre. En un catálogo con varios se añade el modelo
+    o, si falta o se repite dentro del archivo, "producto-<posición>". Las ids son siempre
+    distintas entre sí: dos productos con la misma id se sobrescribirían.
+    """
+    if len(productos) == 1:
+        return [nombre_archivo]
+    # Cosmos DB no admite /, \, ? ni # en las ids; se sustituyen antes de comprobar repetidos
+    modelos = [
+        re.sub(r"[/\\?#]", "-", " ".join(p["Modelo"].split())) if p.get("Modelo") else None
+        for p in productos
+    ]
+    ids = []
+    for idx, modelo in enumerate(modelos):
+        # Un modelo con forma de id posicional podría coincidir con la de otro producto
+        if modelo and modelos.count(modelo) == 1 and not re.fullmatch(r"producto-\d+", modelo):
+            ids.append(f"{nombre_archivo}::{modelo}")
+        else:
+            ids.append(f"{nombre_archivo}::producto-{idx + 1}")
+    assert len(set(ids)) == len(ids), f"ids repetidas en {nombre_archivo}: {ids}"
+    return ids
+
+
+class ErrorAlmacenamiento(Exception):
+    """Error del backend de almacenamiento, independiente del SDK que lo haya producido."""
+
+
+class ErrorConflicto(ErrorAlmacenamiento):
+    """El documento ha cambiado (o ya no existe) desde la versión con la que se quería parchear."""
+
+
+class RepositorioOrdenadores:
+    """
+    Interfaz común de los backends. Los documentos son diccionarios planos con un campo "id".
+
+    Cada escritura devuelve una "versión" opaca del documento (el etag en Cosmos DB, la huella
+    en el resto) que permite después parchearlo sólo si nadie lo ha modificado entretanto.
+    """
+
+    nombre = None
+
+    def facetas(self, campo):
+        """Valores distintos (no nulos) de un campo."""
+        raise NotImplementedError
+
+    def consultar(self, criterios=None):
+        """Documentos cuyos campos coinciden con todos los criterios {campo: valor}."""
+        raise NotImplementedError
+
+    def upsert_muchos(self, documentos):
+        """Inserta o reemplaza los documentos por id. Retorna {id: versión}."""
+        raise NotImplementedError
+
+    def huellas(self, ids):
+        """{id: (huella, versión)} de los documentos guardados, leyendo sólo esos campos."""
+        raise NotImplementedError
+
+    def parchear(self, id, cambios, version):
+        """
+        Actualiza sólo los campos de `cambios` si el documento sigue en `version`.
+        Retorna la nueva versión; lanza ErrorConflicto si el documento ha cambiado.
+        """
+        raise NotImplementedError
+
+    def borrar_muchos(self, documentos):
+        """Borra los documentos indicados (por id); los que ya no existan se ignoran."""
+        raise NotImplementedError
+
+    def recorrer(self, campos=None):
+        """Itera sobre todos los documentos; con `campos`, sólo con esos campos y la id."""
+        raise NotImplementedError
+
+
+#############################
+# Cosmos DB (API SQL)
+#############################
+
+@lru_cache(maxsize=None)
+def _cliente_cosmos(endpoint, key):
+    # Un único CosmosClient por proceso: reutiliza conexiones y la caché de rutas de particiones
+    from azure.cosmos import CosmosClient
+    return CosmosClient(endpoint, key)
+
+
+class RepositorioCosmos(RepositorioOrdenadores):
+    nombre = "cosmos"
+
+    # Cosmos DB admite como máximo 10 operaciones por patch
+    MAX_OPERACIONES_PATCH = 10
+
+    def __init__(self, endpoint, key, concurrencia=8, base_datos=DB_NAME, contenedor=CONTAINER_NAME, crear=False):
+        """Con `crear=True` el contenedor se crea si no existe (p. ej. uno de pruebas)."""
+        with medir("import azure.cosmos"):
+            from azure.cosmos import exceptions, PartitionKey
+        self._errores = exceptions.CosmosHttpResponseError
+        database = _cliente_cosmos(endpoint, key).get_database_client(base_datos)
+        if crear:
+            try:
+                self.container = database.create_container_if_not_exists(
+                    id=contenedor, partition_key=PartitionKey(path="/" + CAMPO_PARTICION)
+                )
+            except self._errores as e:
+                raise ErrorAlmacenamiento(e.message) from e
+        else:
+            self.container = database.get_container_client(contenedor)
+        self.concurrencia = concurrencia
+        self._particion = None
+
+    def _campo_particion(self):
+        # Campo de la clave de partición del contenedor (p. ej. "tipoDeOrdenador"), leído una vez
+        if self._particion is None:
+            try:
+                ruta = self.container.read()["partitionKey"]["paths"][0]
+            except self._errores as e:
+                raise ErrorAlmacenamiento(e.message) from e
+            self._particion = ruta.lstrip("/")
+        return self._particion
+
+    def _version(self, etag, item, campo_particion):
+        # El valor de la partición hace falta para parchear; si el documento no lo tiene no se guarda
+        version = {"etag": etag}
+        if campo_particion in item:
+            version["pk"] = item[campo_particion]
+        return version
+
+    def _query(self, query, parameters=None):
+        try:
+            return list(self.container.query_items(
+                query=query,
+                parameters=parameters or [],
+                enable_cross_partition_query=True
+            ))
+        except self._errores as e:
+            raise ErrorAlmacenamiento(e.message) from e
+
+    def facetas(self, campo):
+        valores = self._query(f'SELECT DISTINCT VALUE c["{campo}"] FROM c')
+        return [valor for valor in valores if valor is not None]
+
+    def consultar(self, criterios=None):
+        query_parts = []
+        parameters = []
+        for i, (campo, valor) in enumerate((criterios or {}).items()):
+            query_parts.append(f'c["{campo}"] = @p{i}')
+            parameters.append({"name": f"@p{i}", "value": valor})
+        query = "SELECT * FROM c"
+        if query_parts:
+            query += " WHERE " + " AND ".join(query_parts)
+        return self._query(query, parameters)
+
+    def upsert_muchos(self, documentos):
+        # La API SQL no tiene escrituras masivas entre particiones; se lanzan en paralelo
+        campo = self._campo_particion()
+        try:
+            if len(documentos) <= 1 or self.concurrencia <= 1:
+                guardados = [self.container.upsert_item(documento) for documento in documentos]
+            else:
+                with ThreadPoolExecutor(max_workers=self.concurrencia) as pool:
+                    guardados = list(pool.map(self.container.upsert_item, documentos))
+        except self._errores as e:
+            raise ErrorAlmacenamiento(e.message) from e
+        return {item["id"]: self._version(item["_etag"], item, campo) for item in guardados}
+
+    def huellas(self, ids):
+        campo = self._campo_particion()
+        resultado = {}
+        for i in range(0, len(ids), TAMANO_LOTE_IDS):
+            items = self._query(
+                f'SELECT c.id, c.huella, c._etag, c["{campo}"] AS pk FROM c WHERE ARRAY_CONTAINS(@ids, c.id)',
+                [{"name": "@ids", "value": ids[i:i + TAMANO_LOTE_IDS]}]
+            )
+            for item in items:
+                resultado[item["id"]] = (item.get("huella"), self._version(item["_etag"], item, "pk"))
+        return resultado
+
+    def parchear(self, id, cambios, version):
+        from azure.core import MatchConditions
+        from azure.cosmos.partition_key import NonePartitionKeyValue
+        partition_key = version.get("pk", NonePartitionKeyValue)
+        operaciones = [
+            {"op": "set", "path": "/" + campo.replace("~", "~0").replace("/", "~1"), "value": valor}
+            for campo, valor in cambios.items()
+        ]
+        try:
+            if len(operaciones) <= self.MAX_OPERACIONES_PATCH:
+                item = self.container.patch_item(
+                    item=id,
+                    partition_key=partition_key,
+                    patch_operations=operaciones,
+                    etag=version["etag"],
+                    match_condition=MatchConditions.IfNotModified
+                )
+            else:
+                # Varios patch seguidos no serían atómicos: se reemplaza el documento entero,
+                # con la misma condición sobre el etag
+                actual = self.container.read_item(item=id, partition_key=partition_key)
+                if actual["_etag"] != version["etag"]:
+                    raise ErrorConflicto(f"El documento {id} ha cambiado")
+                documento = {k: v for k, v in actual.items() if not k.startswith("_")}
+                documento.update(cambios)
+                item = self.container.replace_item(
+                    item=id,
+                    body=documento,
+                    etag=version["etag"],
+                    match_condition=MatchConditions.IfNotModified
+                )
+        except self._errores as e:
+            # 412: el etag ya no coincide; 404: el documento se ha borrado
+            if e.status_code in (404, 412):
+                raise ErrorConflicto(e.message) from e
+            raise ErrorAlmacenamiento(e.message) from e
+        return dict(version, etag=item["_etag"])
+
+    def borrar_muchos(self, documentos):
+        from azure.cosmos.partition_key import NonePartitionKeyValue
+        campo = self._campo_particion()
+
+        def borrar(documento):
+            try:
+                self.container.delete_item(
+                    item=documento["id"],
+                    partition_key=documento.get(campo, NonePartitionKeyValue)
+                )
+            except self._errores as e:
+                if e.status_code != 404:
+                    raise
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, self.concurrencia)) as pool:
+                list(pool.map(borrar, documentos))
+        except self._errores as e:
+            raise ErrorAlmacenamiento(e.message) from e
+
+    def recorrer(self, campos=None):
+        query = "SELECT * FROM c"
+        if campos:
+            # Proyección en el servidor: los campos que falten en un documento no se devuelven
+            proyeccion = ", ".join(f'"{campo}": c["{campo}"]' for campo in campos)
+            query = f'SELECT VALUE {{"id": c.id, {proyeccion}}} FROM c'
+        try:
+            yield from self.container.query_items(query, enable_cross_partition_query=True)
+        except self._errores as e:
+            raise ErrorAlmacenamiento(e.message) from e
+
+
+#############################
+# MongoDB (pymongo)
+#############################
+
+def uri_mongo(cosmos_endpoint, cosmos_key):
+    """Construye la URI de la API de MongoDB de Cosmos a partir del endpoint de la API SQL."""
+    host = cosmos_endpoint.replace("https://", "").replace(":443", "").rstrip("/")
+    return f"mongodb://{host}:{cosmos_key}@{host}/?ssl=true&replicaSet=globaldb"
+
+
+@lru_cache(maxsize=None)
+def cliente_mongo(uri, max_pool_size=50):
+    """MongoClient compartido por proceso; pymongo mantiene internamente el pool de conexiones."""
+    import pymongo
+    return pymongo.MongoClient(uri, maxPoolSize=max_pool_size, retryWrites=False)
+
+
+class RepositorioMongo(RepositorioOrdenadores):
+    nombre = "mongo"
+
+    def __init__(self, uri, tamano_lote=500, base_datos=DB_NAME, contenedor=CONTAINER_NAME):
+        import pymongo
+        from pymongo.errors import PyMongoError
+        self._pymongo = pymongo
+        self._errores = PyMongoError
+        # La colección se crea al escribir en ella si no existe
+        self.collection = cliente_mongo(uri)[base_datos][contenedor]
+        self.tamano_lote = tamano_lote
+        self._crear_indices()
+
+    def _crear_indices(self):
+        try:
+            self.collection.create_indexes(
+                [self._pymongo.IndexModel([(campo, self._pymongo.ASCENDING)]) for campo in CAMPOS_INDEXADOS]
+                + [self._pymongo.IndexModel([("Marca", self._pymongo.ASCENDING), ("Pulgadas", self._pymongo.ASCENDING)])]
+            )
+        except self._errores as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+
+    def facetas(self, campo):
+        try:
+            return [valor for valor in self.collection.distinct(campo) if valor is not None]
+        except self._errores as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+
+    def consultar(self, criterios=None):
+        filtro = dict(criterios or {})
+        if "id" in filtro:
+            filtro["_id"] = filtro.pop("id")
+        try:
+            return list(self.collection.find(filtro, {"_id": 0}))
+        except self._errores as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+
+    def upsert_muchos(self, documentos):
+        # El id de la aplicación se usa como _id para que el upsert vaya por la clave primaria
+        operaciones = [
+            self._pymongo.ReplaceOne({"_id": doc["id"]}, dict(doc, _id=doc["id"]), upsert=True)
+            for doc in documentos
+        ]
+        try:
+            for i in range(0, len(operaciones), self.tamano_lote):
+                self.collection.bulk_write(operaciones[i:i + self.tamano_lote], ordered=False)
+        except self._errores as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+        # Sin etags, la propia huella hace de versión para las actualizaciones condicionales
+        return {doc["id"]: doc.get("huella") for doc in documentos}
+
+    def huellas(self, ids):
+        resultado = {}
+        try:
+            for i in range(0, len(ids), TAMANO_LOTE_IDS):
+                for doc in self.collection.find({"_id": {"$in": ids[i:i + TAMANO_LOTE_IDS]}}, {"huella": 1}):
+                    resultado[doc["_id"]] = (doc.get("huella"), doc.get("huella"))
+        except self._errores as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+        return resultado
+
+    def parchear(self, id, cambios, version):
+        try:
+            resultado = self.collection.update_one({"_id": id, "huella": version}, {"$set": cambios})
+        except self._errores as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+        if resultado.matched_count == 0:
+            raise ErrorConflicto(f"El documento {id} ha cambiado o ya no existe")
+        return cambios.get("huella", version)
+
+    def borrar_muchos(self, documentos):
+        ids = [documento["id"] for documento in documentos]
+        try:
+            for i in range(0, len(ids), TAMANO_LOTE_IDS):
+                self.collection.delete_many({"_id": {"$in": ids[i:i + TAMANO_LOTE_IDS]}})
+        except self._errores as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+
+    def recorrer(self, campos=None):
+        proyeccion = {"_id": 0}
+        if campos:
+            proyeccion.update({campo: 1 for campo in ["id"] + list(campos)})
+        try:
+            yield from self.collection.find({}, proyeccion, batch_size=self.tamano_lote)
+        except self._errores as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+
+
+#############################
+# SQLite local
+#############################
+
+class RepositorioSQLite(RepositorioOrdenadores):
+    """
+    Cada documento se guarda como JSON, y los CAMPOS_INDEXADOS además en columnas propias
+    con índice. Las columnas no tienen tipo declarado para conservar el tipo original del valor.
+    """
+
+    nombre = "sqlite"
+
+    def __init__(self, path="ordenadores.db"):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        columnas = ", ".join(f'"{campo}"' for campo in CAMPOS_INDEXADOS)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS ordenadores (id TEXT PRIMARY KEY, {columnas}, doc TEXT NOT NULL)")
+            for campo in CAMPOS_INDEXADOS:
+                self.conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{campo}" ON ordenadores ("{campo}")')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_marca_pulgadas ON ordenadores ("Marca", "Pulgadas")')
+
+    @staticmethod
+    def _columna(campo):
+        if campo == "id" or campo in CAMPOS_INDEXADOS:
+            return f'"{campo}"'
+        return "json_extract(doc, ?)"
+
+    def _ejecutar(self, sql, parametros=()):
+        try:
+            with self.lock:
+                return self.conn.execute(sql, parametros).fetchall()
+        except sqlite3.Error as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+
+    def facetas(self, campo):
+        columna = self._columna(campo)
+        parametros = [] if columna.startswith('"') else [f'$."{campo}"']
+        filas = self._ejecutar(f"SELECT DISTINCT {columna} FROM ordenadores WHERE {columna} IS NOT NULL", parametros * 2)
+        return [fila[0] for fila in filas]
+
+    def consultar(self, criterios=None):
+        condiciones = []
+        parametros = []
+        for campo, valor in (criterios or {}).items():
+            columna = self._columna(campo)
+            if not columna.startswith('"'):
+                parametros.append(f'$."{campo}"')
+            condiciones.append(f"{columna} = ?")
+            parametros.append(valor)
+        sql = "SELECT doc FROM ordenadores"
+        if condiciones:
+            sql += " WHERE " + " AND ".join(condiciones)
+        return [json.loads(fila[0]) for fila in self._ejecutar(sql, parametros)]
+
+    @staticmethod
+    def _fila(doc):
+        return [doc["id"]] + [doc.get(campo) for campo in CAMPOS_INDEXADOS] + [json.dumps(doc, ensure_ascii=False)]
+
+    def _escribir(self, filas):
+        columnas = ", ".join(f'"{campo}"' for campo in CAMPOS_INDEXADOS)
+        huecos = ", ".join("?" for _ in CAMPOS_INDEXADOS)
+        actualizar = ", ".join(f'"{campo}" = excluded."{campo}"' for campo in CAMPOS_INDEXADOS)
+        self.conn.executemany(
+            f"INSERT INTO ordenadores (id, {columnas}, doc) VALUES (?, {huecos}, ?) "
+            f"ON CONFLICT(id) DO UPDATE SET {actualizar}, doc = excluded.doc",
+            filas
+        )
+
+    def upsert_muchos(self, documentos):
+        try:
+            with self.lock:
+                # Una única transacción para todo el lote
+                with self.conn:
+                    self.conn.execute("BEGIN")
+                    self._escribir([self._fila(doc) for doc in documentos])
+        except sqlite3.Error as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+        # Sin etags, la propia huella hace de versión para las actualizaciones condicionales
+        return {doc["id"]: doc.get("huella") for doc in documentos}
+
+    def huellas(self, ids):
+        resultado = {}
+        for i in range(0, len(ids), TAMANO_LOTE_IDS):
+            lote = ids[i:i + TAMANO_LOTE_IDS]
+            filas = self._ejecutar(
+                f"SELECT id, json_extract(doc, '$.huella') FROM ordenadores WHERE id IN ({', '.join('?' for _ in lote)})",
+                lote
+            )
+            for id, huella in filas:
+                resultado[id] = (huella, huella)
+        return resultado
+
+    def parchear(self, id, cambios, version):
+        try:
+            with self.lock:
+                with self.conn:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                    fila = self.conn.execute("SELECT doc FROM ordenadores WHERE id = ?", (id,)).fetchone()
+                    doc = json.loads(fila[0]) if fila else None
+                    if doc is None or doc.get("huella") != version:
+                        raise ErrorConflicto(f"El documento {id} ha cambiado o ya no existe")
+                    doc.update(cambios)
+                    self._escribir([self._fila(doc)])
+        except sqlite3.Error as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+        return doc.get("huella")
+
+    def borrar_muchos(self, documentos):
+        try:
+            with self.lock:
+                with self.conn:
+                    self.conn.execute("BEGIN")
+                    self.conn.executemany("DELETE FROM ordenadores WHERE id = ?", [(doc["id"],) for doc in documentos])
+        except sqlite3.Error as e:
+            raise ErrorAlmacenamiento(str(e)) from e
+
+    def recorrer(self, campos=None):
+        if not campos:
+            for fila in self._ejecutar("SELECT doc FROM ordenadores"):
+                yield json.loads(fila[0])
+            return
+        # Los campos indexados se leen de sus columnas sin decodificar el JSON
+        columnas = [self._columna(campo) for campo in campos]
+        parametros = [f'$."{campo}"' for campo, columna in zip(campos, columnas) if not columna.startswith('"')]
+        for fila in self._ejecutar(f"SELECT id, {', '.join(columnas)} FROM ordenadores", parametros):
+            yield {campo: valor for campo, valor in zip(["id"] + list(campos), fila) if valor is not None}
+
+
+#############################
+# Selección de backend
+#############################
+
+def crear_repositorio(backend=None, contenedor=None):
+    """
+    Crea un repositorio nuevo del backend indicado o, si no se indica, del definido en
+    ALMACENAMIENTO. Con `contenedor` se usa ese contenedor (o colección) de la base de datos
+    en lugar del configurado, y se crea si no existe; en SQLite se ignora.
+    """
+    config = obtener_configuracion()
+    backend = (backend or config.almacenamiento).lower()
+    if backend == "cosmos":
+        if not all([config.cosmos_endpoint, config.cosmos_key]):
+            raise ValueError("Faltan variables de entorno para Cosmos DB. Verifica tu archivo .env")
+        return RepositorioCosmos(
+            config.cosmos_endpoint, config.cosmos_key, config.cosmos_concurrencia,
+            config.base_datos, contenedor or config.contenedor, crear=contenedor is not None
+        )
+    if backend == "mongo":
+        uri = config.mongo_uri
+        if not uri:
+            if not all([config.cosmos_endpoint, config.cosmos_key]):
+                raise ValueError("Faltan MONGO_URI o las variables de Cosmos DB. Verifica tu archivo .env")
+            uri = uri_mongo(config.cosmos_endpoint, config.cosmos_key)
+        return RepositorioMongo(uri, config.mongo_tamano_lote, config.base_datos, contenedor or config.contenedor)
+    if backend == "sqlite":
+        return RepositorioSQLite(config.sqlite_path)
+    raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
+
+
+@lru_cache(maxsize=None)
+def obtener_repositorio(backend=None):
+    """
+    Repositorio del catálogo para el backend indicado (o el de ALMACENAMIENTO), creado una
+    sola vez por proceso.
+    """
+    return crear_repositorio(backend)
@@ -0,0 +1,229 @@
+"""
+Índice de autocompletado en memoria sobre Marca, Modelo y Procesador.
+
+Es un array ordenado de claves normalizadas (minúsculas, sin acentos) en el que se busca
+por prefijo con bisect. Cada valor se indexa también desde el inicio de cada palabra, así
+que "i7" encuentra "Intel Core i7". Se construye la primera vez que hay texto que sugerir,
+se actualiza de forma incremental al ingerir nuevos productos y se refresca en segundo plano.
+"""
+import bisect
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+from almacenamiento import ErrorAlmacenamiento
+
+CAMPOS_AUTOCOMPLETADO = ["Marca", "Modelo", "Procesador"]
+
+# Máximo de claves que se recorren por consulta; acota el coste de prefijos muy cortos
+MAX_CANDIDATOS = 1000
+
+# Segundos de espera tras una construcción fallida antes de volver a leer el catálogo
+ESPERA_REINTENTO = 60
+
+Sugerencia = namedtuple("Sugerencia", ["campo", "valor", "productos"])
+
+
+def normalizar(texto):
+    sin_acentos = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return " ".join(sin_acentos.lower().split())
+
+
+class IndiceAutocompletado:
+    def __init__(self, campos=CAMPOS_AUTOCOMPLETADO):
+        self.campos = campos
+        # (clave, palabra en la que empieza, campo, valor), ordenado
+        self.claves = []
+        # (campo, valor) -> número de productos con ese valor
+        self.productos = {}
+        # valor normalizado -> [(campo, valor)]
+        self.exactas = {}
+        # id del producto -> {campo: valor} indexados, para reemplazarlos al volver a ingerirlo
+        self.valores_por_id = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _claves(campo, valor):
+        palabras = normalizar(valor).split(" ")
+        return [(" ".join(palabras[i:]), i, campo, valor) for i in range(len(palabras))]
+
+    def _sumar(self, par, nuevas):
+        if par not in self.productos:
+            self.productos[par] = 0
+            nuevas.extend(self._claves(*par))
+            self.exactas.setdefault(normalizar(par[1]), []).append(par)
+        self.productos[par] += 1
+
+    def _restar(self, par, nuevas):
+        self.productos[par] -= 1
+        if self.productos[par] > 0:
+            return
+        del self.productos[par]
+        for clave in self._claves(*par):
+            # La clave puede estar ya en el índice o pendiente de insertar en este mismo lote
+            i = bisect.bisect_left(self.claves, clave)
+            if i < len(self.claves) and self.claves[i] == clave:
+                del self.claves[i]
+            elif clave in nuevas:
+                nuevas.remove(clave)
+        normalizado = normalizar(par[1])
+        self.exactas[normalizado].remove(par)
+        if not self.exactas[normalizado]:
+            del self.exactas[normalizado]
+
+    def agregar_muchos(self, documentos):
+        """Añade los documentos o, si su id ya estaba indexada, reemplaza sus valores anteriores."""
+        nuevas = []
+        with self.lock:
+            for documento in documentos:
+                id = documento.get("id")
+                anteriores = self.valores_por_id.get(id, {})
+                actuales = {}
+                for campo in self.campos:
+                    valor = documento.get(campo)
+                    if isinstance(valor, str) and valor.strip():
+                        actuales[campo] = valor
+                if actuales == anteriores:
+                    continue
+                for par in anteriores.items():
+                    if actuales.get(par[0]) != par[1]:
+                        self._restar(par, nuevas)
+                for par in actuales.items():
+                    if anteriores.get(par[0]) != par[1]:
+                        self._sumar(par, nuevas)
+                self.valores_por_id[id] = actuales
+            # Pocas claves nuevas (una ingesta): inserción ordenada; muchas (construcción): ordenar de una vez
+            if len(nuevas) <= 32:
+                for clave in nuevas:
+                    bisect.insort(self.claves, clave)
+            else:
+                self.claves.extend(nuevas)
+                self.claves.sort()
+
+    def sugerir(self, texto, limite=8):
+        """
+        Sugerencias cuyo valor (o alguna de sus palabras) empieza por el texto. Primero las que
+        coinciden desde el principio del valor, después las de más productos y las más cortas.
+        """
+        prefijo = normalizar(texto)
+        if not prefijo:
+            return []
+        candidatos = {}
+        with self.lock:
+            i = bisect.bisect_left(self.claves, (prefijo,))
+            fin = min(len(self.claves), i + MAX_CANDIDATOS)
+            while i < fin and self.claves[i][0].startswith(prefijo):
+                _, posicion, campo, valor = self.claves[i]
+                par = (campo, valor)
+                candidatos[par] = min(posicion, candidatos.get(par, posicion))
+                i += 1
+            ordenados = sorted(
+                candidatos.items(),
+                key=lambda item: (item[1] > 0, -self.productos[item[0]], len(item[0][1]), item[0][1])
+            )
+            return [Sugerencia(campo, valor, self.productos[(campo, valor)]) for (campo, valor), _ in ordenados[:limite]]
+
+    def exacta(self, texto):
+        """La sugerencia cuyo valor coincide exactamente con el texto (sin mayúsculas ni acentos), o None."""
+        with self.lock:
+            pares = self.exactas.get(normalizar(texto))
+            if not pares:
+                return None
+            campo, valor = max(pares, key=lambda par: self.productos[par])
+            return Sugerencia(campo, valor, self.productos[(campo, valor)])
+
+
+class _EstadoIndice:
+    def __init__(self):
+        self.indice = None
+        self.creado = 0
+        # Serializa la primera construcción, sin bloquear a las sesiones de otros repositorios
+        self.construccion = threading.Lock()
+        self.reconstruyendo = False
+        # Hasta cuándo no se reintenta tras un fallo, para no recorrer el catálogo en cada rerun
+        self.reintentar_en = 0
+        # Documentos ingeridos mientras se reconstruye; se aplican al índice nuevo antes de publicarlo
+        self.pendientes = []
+
+
+_estados = {}
+_estados_lock = threading.Lock()
+
+
+def _estado(repositorio):
+    with _estados_lock:
+        return _estados.setdefault(repositorio, _EstadoIndice())
+
+
+def _construir(repositorio, estado):
+    # La lectura del catálogo se hace sin ningún lock tomado, y sólo de los campos indexados
+    nuevo = IndiceAutocompletado()
+    nuevo.agregar_muchos(repositorio.recorrer(nuevo.campos))
+    with _estados_lock:
+        nuevo.agregar_muchos(estado.pendientes)
+        estado.indice, estado.creado = nuevo, time.monotonic()
+        estado.pendientes = []
+        estado.reconstruyendo = False
+
+
+def _fallo(estado):
+    with _estados_lock:
+        estado.pendientes = []
+        estado.reconstruyendo = False
+        estado.reintentar_en = time.monotonic() + ESPERA_REINTENTO
+
+
+def _reconstruir(repositorio, estado):
+    try:
+        _construir(repositorio, estado)
+    except Exception as ex:
+        # Se sigue sirviendo el índice anterior; se reintentará pasados ESPERA_REINTENTO segundos
+        print(f"Error al reconstruir el índice de autocompletado: {ex}")
+        _fallo(estado)
+
+
+def obtener_indice(repositorio, ttl=600):
+    """
+    Índice del catálogo del repositorio, compartido por todas las sesiones del proceso. La
+    primera llamada lo construye; después, pasados `ttl` segundos, se reconstruye en segundo
+    plano para recoger lo ingerido desde otros procesos (p. ej. ServicioIngesta.py) y
+    mientras tanto se sigue devolviendo el anterior.
+
+    Si la primera construcción falla se lanza ErrorAlmacenamiento, también durante los
+    ESPERA_REINTENTO segundos siguientes sin volver a intentarlo.
+    """
+    estado = _estado(repositorio)
+    with _estados_lock:
+        ahora = time.monotonic()
+        if estado.indice is not None:
+            if ahora - estado.creado > ttl and ahora >= estado.reintentar_en and not estado.reconstruyendo:
+                estado.reconstruyendo = True
+                threading.Thread(target=_reconstruir, args=(repositorio, estado), daemon=True).start()
+            return estado.indice
+        if ahora < estado.reintentar_en:
+            raise ErrorAlmacenamiento("el índice de autocompletado no se pudo construir; se reintentará en breve")
+    with estado.construccion:
+        if estado.indice is None:
+            with _estados_lock:
+                estado.reconstruyendo = True
+            try:
+                _construir(repositorio, estado)
+            except Exception:
+                _fallo(estado)
+                raise
+        return estado.indice
+
+
+def actualizar_indice(repositorio, documentos):
+    """
+    Aplica los documentos recién ingeridos al índice ya construido. Si todavía no hay índice
+    no se hace nada: cuando se construya ya leerá estos documentos del catálogo.
+    """
+    estado = _estado(repositorio)
+    with _estados_lock:
+        indice = estado.indice
+        if estado.reconstruyendo:
+            # El índice en construcción puede haber leído el catálogo antes de esta escritura
+            estado.pendientes.extend(documentos)
+    if indice is not None:
+        indice.agregar_muchos(documentos)
@@ -0,0 +1,99 @@
+"""
+Compara los backends de almacenamiento con la misma carga de trabajo: escritura masiva
+de un catálogo sintético, facetas de marcas y pulgadas, búsquedas por criterios y
+recorrido completo.
+
+    python benchmark_almacenamiento.py sqlite
+    python benchmark_almacenamiento.py cosmos mongo sqlite --documentos 2000
+
+Nunca se toca el catálogo real: SQLite se mide sobre un archivo temporal, y en Cosmos DB y
+MongoDB se usa un contenedor (o colección) aparte de la misma base de datos, que se crea si
+no existe (--contenedor, por defecto "Especificaciones_benchmark"). Los documentos "bench-*"
+se borran antes de empezar, por si quedaron de una ejecución interrumpida, y al terminar.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from almacenamiento import crear_repositorio, RepositorioSQLite
+from autocompletado import CAMPOS_AUTOCOMPLETADO
+from configuracion import obtener_configuracion
+
+MARCAS = ["ASUS", "LENOVO", "HP", "DELL", "ACER", "MSI", "APPLE", "SAMSUNG"]
+PULGADAS = ["13.3", "14", "15.6", "16", "17.3"]
+PROCESADORES = ["Intel Core i5", "Intel Core i7", "AMD Ryzen 5", "AMD Ryzen 7", "Apple M2"]
+
+
+def catalogo_sintetico(n, semilla=42):
+    aleatorio = random.Random(semilla)
+    return [
+        {
+            "id": f"bench-{i}",
+            "nombre_archivo": f"bench-{i}.pdf",
+            "Marca": aleatorio.choice(MARCAS),
+            "Modelo": f"Modelo {i}",
+            "Procesador": aleatorio.choice(PROCESADORES),
+            "RAM": aleatorio.choice(["8GB", "16GB", "32GB"]),
+            "Almacenamiento": aleatorio.choice(["256", "512", "1024"]),
+            "Tarjeta gráfica": None,
+            "Pulgadas": aleatorio.choice(PULGADAS),
+            "Precio": aleatorio.randint(400, 3000),
+            "Frecuencia procesador": aleatorio.choice(["2.4", "3.2", "4.1"]),
+            "tipoDeOrdenador": "Portátil",
+        }
+        for i in range(n)
+    ]
+
+
+def cronometrar(nombre, funcion, repeticiones=1):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    ms = (time.perf_counter() - inicio) * 1000 / repeticiones
+    print(f"  {nombre:<28} {ms:10.2f} ms")
+    return resultado
+
+
+def ejecutar(backend, documentos, consultas, directorio_temporal, contenedor):
+    print(f"\n=== {backend} ===")
+    if backend == "sqlite":
+        path = os.path.join(directorio_temporal, "benchmark.db")
+        repositorio = cronometrar("conexión", lambda: RepositorioSQLite(path))
+    else:
+        repositorio = cronometrar("conexión", lambda: crear_repositorio(backend, contenedor))
+        # Restos de una ejecución anterior interrumpida: la carga tiene que ser la misma en todos
+        repositorio.borrar_muchos(documentos)
+    try:
+        cronometrar(f"upsert_muchos ({len(documentos)})", lambda: repositorio.upsert_muchos(documentos))
+        cronometrar("facetas Marca + Pulgadas", lambda: (repositorio.facetas("Marca"), repositorio.facetas("Pulgadas")), 5)
+        cronometrar(f"consultar x{len(consultas)}", lambda: [repositorio.consultar(c) for c in consultas])
+        cronometrar("consultar por id", lambda: repositorio.consultar({"id": documentos[-1]["id"]}), 5)
+        cronometrar("recorrer", lambda: sum(1 for _ in repositorio.recorrer()))
+        cronometrar("recorrer (autocompletado)", lambda: sum(1 for _ in repositorio.recorrer(CAMPOS_AUTOCOMPLETADO)))
+    finally:
+        # Que los productos de prueba no queden en el catálogo real
+        cronometrar(f"borrar_muchos ({len(documentos)})", lambda: repositorio.borrar_muchos(documentos))
+        if backend == "sqlite":
+            repositorio.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los backends de almacenamiento.")
+    parser.add_argument("backends", nargs="+", choices=["cosmos", "mongo", "sqlite"])
+    parser.add_argument("--documentos", type=int, default=1000)
+    parser.add_argument("--contenedor", default="Especificaciones_benchmark",
+                        help="Contenedor (o colección) de pruebas en Cosmos DB y MongoDB.")
+    args = parser.parse_args()
+    if args.contenedor == obtener_configuracion().contenedor:
+        parser.error("El contenedor de pruebas no puede ser el del catálogo real")
+
+    documentos = catalogo_sintetico(args.documentos)
+    consultas = [{"Marca": m} for m in MARCAS] + [{"Marca": m, "Pulgadas": p} for m in MARCAS for p in PULGADAS]
+    with tempfile.TemporaryDirectory() as directorio_temporal:
+        for backend in args.backends:
+            ejecutar(backend, documentos, consultas, directorio_temporal, args.contenedor)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,18 @@
-import pymongo
 import os
 from dotenv import load_dotenv
+from almacenamiento import uri_mongo, cliente_mongo
 
 # Cargar variables de entorno
 load_dotenv()
-cosmos_endpoint = os.getenv('COSMOS_ENDPOINT').replace("https://", "").replace(":443", "")
+cosmos_endpoint = os.getenv('COSMOS_ENDPOINT')
 cosmos_key = os.getenv('COSMOS_KEY')
 
 # Construcción de la URI
-uri = f"mongodb://{cosmos_endpoint}:{cosmos_key}@{cosmos_endpoint}/?ssl=true&replicaSet=globaldb"
+uri = os.getenv('MONGO_URI') or uri_mongo(cosmos_endpoint, cosmos_key)
 
 try:
-    # Conectar a MongoDB
-    mongo_client = pymongo.MongoClient(uri)
+    # Conectar a MongoDB (mismo cliente compartido que usa almacenamiento.py)
+    mongo_client = cliente_mongo(uri)
     db = mongo_client['OrdenadoresDB']  # Base de datos
 
     # Verificar conexión con 'ping'
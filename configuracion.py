@@ -0,0 +1,58 @@
+"""
+Configuración de la aplicación leída una sola vez del entorno (y del archivo .env).
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from dotenv import load_dotenv
+
+
+@dataclass(frozen=True)
+class Configuracion:
+    # Language (CLU)
+    ls_conversations_endpoint: str
+    ls_conversations_key: str
+    # Document Intelligence (Form Recognizer)
+    doc_endpoint: str
+    doc_key: str
+    doc_model_id: str
+    # Base de datos
+    almacenamiento: str
+    base_datos: str
+    contenedor: str
+    cosmos_endpoint: str
+    cosmos_key: str
+    cosmos_concurrencia: int
+    mongo_uri: str
+    mongo_tamano_lote: int
+    sqlite_path: str
+    manifiesto_dir: str
+    # Autocompletado
+    autocompletado_ttl: int
+    # Perfil de arranque (perfil.py)
+    perfil_arranque: bool
+
+
+@lru_cache(maxsize=None)
+def obtener_configuracion():
+    """Carga el .env y construye la configuración; las llamadas siguientes reutilizan el resultado."""
+    load_dotenv()
+    return Configuracion(
+        ls_conversations_endpoint=os.getenv("LS_CONVERSATIONS_ENDPOINT"),
+        ls_conversations_key=os.getenv("LS_CONVERSATIONS_KEY"),
+        doc_endpoint=os.getenv("AZURE_ENDPOINT_DOCUMEN_INTELLIGENCE"),
+        doc_key=os.getenv("AZURE_API_KEY_DOCUMEN_INTELLIGENCE"),
+        doc_model_id=os.getenv("MODEL"),
+        almacenamiento=os.getenv("ALMACENAMIENTO", "cosmos").lower(),
+        base_datos=os.getenv("BASE_DATOS", "OrdenadoresDB"),
+        contenedor=os.getenv("CONTENEDOR", "Especificaciones"),
+        cosmos_endpoint=os.getenv("COSMOS_ENDPOINT"),
+        cosmos_key=os.getenv("COSMOS_KEY"),
+        cosmos_concurrencia=int(os.getenv("COSMOS_CONCURRENCIA", "8")),
+        mongo_uri=os.getenv("MONGO_URI"),
+        mongo_tamano_lote=int(os.getenv("MONGO_TAMANO_LOTE", "500")),
+        sqlite_path=os.getenv("SQLITE_PATH", "ordenadores.db"),
+        manifiesto_dir=os.getenv("MANIFIESTO_DIR", "."),
+        autocompletado_ttl=int(os.getenv("AUTOCOMPLETADO_TTL", "600")),
+        perfil_arranque=os.getenv("PERFIL_ARRANQUE", "") not in ("", "0"),
+    )
@@ -0,0 +1,150 @@
+"""
+Huellas de los documentos normalizados, para que volver a ingerir una ficha que no ha
+cambiado no cueste ninguna escritura.
+
+La huella es un hash de los campos de negocio (todo salvo id, huella, fecha_procesamiento
+y los campos de sistema que empiezan por "_"). Un manifiesto local en SQLite recuerda, por
+documento, la última huella, los campos escritos y la versión devuelta por el backend.
+Sin manifiesto (otra máquina, o se ha borrado) las huellas se piden en bloque a la base de datos.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+from almacenamiento import ErrorConflicto
+from configuracion import obtener_configuracion
+
+CAMPOS_SIN_HUELLA = {"id", "huella", "fecha_procesamiento"}
+
+
+def campos_de_negocio(documento):
+    return {k: v for k, v in documento.items() if k not in CAMPOS_SIN_HUELLA and not k.startswith("_")}
+
+
+def calcular_huella(documento):
+    """Hash estable de los campos de negocio: no depende del orden de las claves."""
+    contenido = json.dumps(campos_de_negocio(documento), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(contenido.encode("utf8")).hexdigest()
+
+
+class Manifiesto:
+    """Última huella, campos y versión escritos de cada documento, guardados en SQLite."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS manifiesto (
+                    id TEXT PRIMARY KEY,
+                    huella TEXT NOT NULL,
+                    campos TEXT NOT NULL,
+                    version TEXT
+                )
+            """)
+
+    def obtener(self, ids):
+        """{id: (huella, campos, versión)} de los ids que estén en el manifiesto."""
+        resultado = {}
+        with self.lock:
+            for i in range(0, len(ids), 500):
+                lote = ids[i:i + 500]
+                filas = self.conn.execute(
+                    f"SELECT id, huella, campos, version FROM manifiesto WHERE id IN ({', '.join('?' for _ in lote)})",
+                    lote
+                ).fetchall()
+                for id, huella, campos, version in filas:
+                    resultado[id] = (huella, json.loads(campos), json.loads(version))
+        return resultado
+
+    def guardar(self, entradas):
+        """Guarda una lista de (id, huella, campos, versión)."""
+        filas = [
+            (id, huella, json.dumps(campos, ensure_ascii=False, default=str), json.dumps(version))
+            for id, huella, campos, version in entradas
+        ]
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO manifiesto (id, huella, campos, version) VALUES (?, ?, ?, ?)",
+                    filas
+                )
+
+
+@lru_cache(maxsize=None)
+def obtener_manifiesto(backend):
+    # Un manifiesto por backend: las huellas de Cosmos DB no sirven para la base SQLite local
+    config = obtener_configuracion()
+    return Manifiesto(os.path.join(config.manifiesto_dir, f"manifiesto_huellas_{backend}.db"))
+
+
+def escribir_cambiados(repositorio, documentos, manifiesto=None):
+    """
+    Añade la huella a cada documento y escribe sólo lo que ha cambiado:
+      - misma huella que la guardada: no se escribe nada
+      - huella distinta y campos anteriores conocidos: patch condicional (por versión) sólo
+        de los campos que difieren
+      - documento nuevo, sin campos anteriores o con conflicto: upsert completo, todos en
+        una única escritura masiva
+    Retorna {"omitidos": [...], "parcheados": [...], "completos": [...]} con las ids.
+    """
+    if manifiesto is None:
+        manifiesto = obtener_manifiesto(repositorio.nombre)
+    for documento in documentos:
+        documento["huella"] = calcular_huella(documento)
+
+    ids = [documento["id"] for documento in documentos]
+    locales = manifiesto.obtener(ids)
+    desconocidos = [id for id in ids if id not in locales]
+    remotas = repositorio.huellas(desconocidos) if desconocidos else {}
+
+    resultado = {"omitidos": [], "parcheados": [], "completos": []}
+    completos = []
+    entradas = []
+    try:
+        for documento in documentos:
+            id = documento["id"]
+            campos = campos_de_negocio(documento)
+            if id in locales:
+                huella, campos_previos, version = locales[id]
+            elif id in remotas:
+                (huella, version), campos_previos = remotas[id], None
+            else:
+                completos.append(documento)
+                continue
+
+            if huella == documento["huella"]:
+                resultado["omitidos"].append(id)
+                if campos_previos is None:
+                    entradas.append((id, huella, campos, version))
+                continue
+            if campos_previos is None or version is None:
+                completos.append(documento)
+                continue
+
+            cambios = {k: v for k, v in campos.items() if campos_previos.get(k) != v}
+            cambios.update({k: None for k in campos_previos if k not in campos})
+            cambios["huella"] = documento["huella"]
+            if "fecha_procesamiento" in documento:
+                cambios["fecha_procesamiento"] = documento["fecha_procesamiento"]
+            try:
+                version = repositorio.parchear(id, cambios, version)
+            except ErrorConflicto:
+                # Alguien lo ha modificado desde nuestra última escritura: se reemplaza entero
+                completos.append(documento)
+                continue
+            resultado["parcheados"].append(id)
+            entradas.append((id, documento["huella"], campos, version))
+
+        if completos:
+            versiones = repositorio.upsert_muchos(completos)
+            for documento in completos:
+                resultado["completos"].append(documento["id"])
+                entradas.append((documento["id"], documento["huella"], campos_de_negocio(documento), versiones.get(documento["id"])))
+    finally:
+        manifiesto.guardar(entradas)
+    return resultado
@@ -1,25 +1,19 @@
 import streamlit as st
 from dotenv import load_dotenv
-import os
-from azure.cosmos import CosmosClient, exceptions
+from almacenamiento import obtener_repositorio, ErrorAlmacenamiento
 
 def main():
     try:
         # Cargar variables de entorno
         load_dotenv()
-        cosmos_endpoint = os.getenv('COSMOS_ENDPOINT')
-        cosmos_key = os.getenv('COSMOS_KEY')
 
-        # Crear cliente de Cosmos DB
-        cosmos_client = CosmosClient(cosmos_endpoint, cosmos_key)
-        database = cosmos_client.get_database_client("OrdenadoresDB")
-        container = database.get_container_client("Especificaciones")
+        # Repositorio de ordenadores (Cosmos DB, MongoDB o SQLite según ALMACENAMIENTO)
+        repositorio = obtener_repositorio()
 
         st.title("Mostrar Todos los Ordenadores")
 
-        # Consultar todos los documentos en el contenedor
-        query = "SELECT * FROM c"
-        documents = container.query_items(query, enable_cross_partition_query=True)
+        # Consultar todos los documentos
+        documents = list(repositorio.recorrer())
 
         # Mostrar resultados
         if documents:
@@ -29,8 +23,8 @@ def main():
         else:
             st.write("No se encontraron ordenadores en la base de datos.")
 
-    except exceptions.CosmosHttpResponseError as ex:
-        st.error(f"Error en Cosmos DB: {ex.message}")
+    except ErrorAlmacenamiento as ex:
+        st.error(f"Error en la base de datos: {ex}")
     except Exception as ex:
         st.error(f"Error: {ex}")
 
@@ -0,0 +1,32 @@
+"""
+Modo de perfilado del arranque. Con PERFIL_ARRANQUE=1 en el entorno (o en el .env) se mide
+cuánto tarda cada import pesado y cada inicialización de cliente:
+
+    PERFIL_ARRANQUE=1 streamlit run ChatOrdenadores.py
+
+Sólo se guarda la primera medición de cada componente, que es la que paga el arranque en frío.
+"""
+import time
+from contextlib import contextmanager
+from configuracion import obtener_configuracion
+
+
+def activo():
+    # Se lee de la configuración, es decir, después de cargar el .env
+    return obtener_configuracion().perfil_arranque
+
+
+# componente -> milisegundos, en el orden en que se midieron
+TIEMPOS = {}
+
+
+@contextmanager
+def medir(componente):
+    if not activo():
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        TIEMPOS.setdefault(componente, (time.perf_counter() - inicio) * 1000)
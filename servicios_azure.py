@@ -0,0 +1,53 @@
+"""
+Clientes de los servicios de IA de Azure que usa la aplicación.
+
+Viven en un módulo importado (y no en ChatOrdenadores.py) porque Streamlit vuelve a
+ejecutar el script principal en cada interacción: aquí la caché sí dura todo el proceso,
+así que cada cliente y su pool de conexiones HTTP se crean una sola vez y se comparten
+entre sesiones. Los SDK se importan en el primer uso: la mayoría de sesiones no suben
+ningún PDF.
+"""
+import atexit
+from functools import lru_cache
+from configuracion import obtener_configuracion
+from perfil import medir
+
+
+@lru_cache(maxsize=None)
+def init_form_recognizer():
+    """
+    Inicializa (una sola vez por proceso) y retorna el cliente de Form Recognizer y el modelo custom.
+    """
+    config = obtener_configuracion()
+    if not all([config.doc_endpoint, config.doc_key, config.doc_model_id]):
+        raise ValueError("Faltan variables de entorno para Form Recognizer.")
+    with medir("import azure.ai.formrecognizer"):
+        from azure.core.credentials import AzureKeyCredential
+        from azure.ai.formrecognizer import DocumentAnalysisClient
+    with medir("cliente Form Recognizer"):
+        client = DocumentAnalysisClient(
+            endpoint=config.doc_endpoint,
+            credential=AzureKeyCredential(config.doc_key)
+        )
+    atexit.register(client.close)
+    return client, config.doc_model_id
+
+
+@lru_cache(maxsize=None)
+def init_clu():
+    """
+    Inicializa (una sola vez por proceso) y retorna el cliente de Conversational Language Understanding.
+    """
+    config = obtener_configuracion()
+    if not all([config.ls_conversations_endpoint, config.ls_conversations_key]):
+        raise ValueError("Faltan variables de entorno para Language (CLU).")
+    with medir("import azure.ai.language.conversations"):
+        from azure.core.credentials import AzureKeyCredential
+        from azure.ai.language.conversations import ConversationAnalysisClient
+    with medir("cliente CLU"):
+        client = ConversationAnalysisClient(
+            config.ls_conversations_endpoint,
+            AzureKeyCredential(config.ls_conversations_key)
+        )
+    atexit.register(client.close)
+    return client